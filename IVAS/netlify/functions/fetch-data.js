@@ -1,4 +1,4 @@
-const { CookieParser, IVASClient, ResponseHelper } = require('./utils');
+const { CookieParser, IVASClient, ResponseHelper, SOCIAL_MEDIA_RE } = require('./utils');
 
 exports.handler = async (event) => {
     // Handle CORS preflight
@@ -34,46 +34,38 @@ exports.handler = async (event) => {
         const client = new IVASClient(cookies);
         const smsData = await client.fetchSMSData();
         
-        // Filter for social media
-        const filteredData = smsData.filter(item => {
-            const service = (item.service || '').toLowerCase();
-            return ['facebook', 'instagram', 'whatsapp'].some(keyword => 
-                service.includes(keyword));
-        });
-        
-        // Calculate statistics
-        const serviceCount = {};
-        const countryCount = {};
+        // Filter and calculate statistics in a single pass
+        const cutoff = Date.now() - 5 * 60 * 1000;
+        const filteredData = [];
+        const recentData = [];
+        const serviceCount = new Map();
+        const countryCount = new Map();
         
-        filteredData.forEach(item => {
+        smsData.forEach(item => {
             const service = item.service;
+            if (!SOCIAL_MEDIA_RE.test(service || '')) return;
+            
             const country = item.country;
+            filteredData.push(item);
+            serviceCount.set(service, (serviceCount.get(service) || 0) + 1);
+            countryCount.set(country, (countryCount.get(country) || 0) + 1);
             
-            serviceCount[service] = (serviceCount[service] || 0) + 1;
-            countryCount[country] = (countryCount[country] || 0) + 1;
+            // Recent data (last 5 minutes)
+            if (item.timestamp > cutoff) {
+                recentData.push(item);
+            }
         });
         
         // Get top services
-        const topServices = Object.entries(serviceCount)
+        const topServices = Array.from(serviceCount)
             .sort((a, b) => b[1] - a[1])
             .slice(0, 10);
         
         // Get top countries
-        const topCountries = Object.entries(countryCount)
+        const topCountries = Array.from(countryCount)
             .sort((a, b) => b[1] - a[1])
             .slice(0, 10);
         
-        // Get recent data (last 5 minutes)
-        const cutoff = new Date(Date.now() - 5 * 60 * 1000);
-        const recentData = filteredData.filter(item => {
-            try {
-                const itemTime = new Date(item.timestamp);
-                return itemTime > cutoff;
-            } catch {
-                return false;
-            }
-        });
-        
         return ResponseHelper.success({
             total: filteredData.length,
             recent: recentData.length,
@@ -1,4 +1,4 @@
-const { CookieParser, IVASClient, ResponseHelper } = require('./utils');
+const { CookieParser, IVASClient, ResponseHelper, SOCIAL_MEDIA_RE } = require('./utils');
 
 exports.handler = async (event) => {
     // Handle CORS preflight
@@ -32,34 +32,33 @@ exports.handler = async (event) => {
         const client = new IVASClient(cookies);
         const smsData = await client.fetchSMSData();
         
-        // Apply filters
-        const filteredData = smsData.filter(item => {
-            const itemService = (item.service || '').toLowerCase();
-            const itemCountry = (item.country || '').toLowerCase();
-            
-            // Check if matches filters
-            const serviceMatch = !serviceFilter || itemService.includes(serviceFilter);
-            const countryMatch = !countryFilter || itemCountry.includes(countryFilter);
-            
-            return serviceMatch && countryMatch && 
-                ['facebook', 'instagram', 'whatsapp'].some(keyword => 
-                    itemService.includes(keyword));
-        });
-        
-        // Calculate detailed stats
+        // Apply filters and calculate detailed stats in a single pass
+        const filteredData = [];
+        const seenRanges = new Set();
         const stats = {
-            total: filteredData.length,
+            total: 0,
             by_service: {},
             by_country: {},
             by_hour: {},
-            ranges: new Set(),
+            ranges: [],
             service_distribution: {},
             country_distribution: {}
         };
         
-        filteredData.forEach(item => {
-            const service = item.service;
-            const country = item.country;
+        // Timestamps are epoch ms; bucket hours in server-local time
+        const tzOffset = new Date().getTimezoneOffset() * 60000;
+        const hourCounts = new Uint32Array(24);
+        
+        smsData.forEach(item => {
+            const service = item.service || '';
+            const country = item.country || '';
+            
+            // Check if matches filters
+            if (serviceFilter && !service.toLowerCase().includes(serviceFilter)) return;
+            if (countryFilter && !country.toLowerCase().includes(countryFilter)) return;
+            if (!SOCIAL_MEDIA_RE.test(service)) return;
+            
+            filteredData.push(item);
             const smsRange = item.range || 'N/A';
             
             // Service stats
@@ -68,18 +67,19 @@ exports.handler = async (event) => {
             // Country stats
             stats.by_country[country] = (stats.by_country[country] || 0) + 1;
             
-            // Range stats
-            if (smsRange && smsRange !== 'N/A') {
-                stats.ranges.add(smsRange);
+            // Range stats (first 20 distinct ranges, in order seen)
+            if (smsRange && smsRange !== 'N/A' && !seenRanges.has(smsRange)) {
+                seenRanges.add(smsRange);
+                if (stats.ranges.length < 20) stats.ranges.push(smsRange);
             }
             
             // Hourly stats
-            try {
-                const hour = new Date(item.timestamp).getHours();
-                stats.by_hour[hour] = (stats.by_hour[hour] || 0) + 1;
-            } catch (e) {
-                // Ignore timestamp errors
-            }
+            const hour = Math.floor((item.timestamp - tzOffset) / 3600000) % 24;
+            hourCounts[hour]++;
+        });
+        stats.total = filteredData.length;
+        hourCounts.forEach((count, hour) => {
+            if (count) stats.by_hour[hour] = count;
         });
         
         // Calculate percentages
@@ -101,12 +101,12 @@ exports.handler = async (event) => {
         
         return ResponseHelper.success({
             stats: stats,
-            ranges: Array.from(stats.ranges).slice(0, 20),
+            ranges: stats.ranges,
             summary: {
                 total_filtered: filteredData.length,
                 services_count: Object.keys(stats.by_service).length,
                 countries_count: Object.keys(stats.by_country).length,
-                unique_ranges: stats.ranges.size
+                unique_ranges: seenRanges.size
             }
         });
         
@@ -1,12 +1,48 @@
+const https = require('https');
+const { finished } = require('stream');
+const { StringDecoder } = require('string_decoder');
 const axios = require('axios');
-const cheerio = require('cheerio');
+const { Parser } = require('htmlparser2');
+
+// Warm function instances keep module state, so dashboards polling with the
+// same cookie string skip re-parsing and, within the TTL, re-fetching.
+const COOKIE_CACHE_SIZE = 256;
+const SMS_CACHE_SIZE = 64;
+const SMS_CACHE_TTL = 5000;
+const SMS_FETCH_TIMEOUT = 30000;
+const parsedCookieCache = new Map();
+const smsDataCache = new Map();
+
+const BASE64_RE = /^[A-Za-z0-9+/]+={0,2}$/;
+const BASE64_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/';
+// name=value pairs of a raw Cookie header, anchored to the start of each
+// ';'-separated fragment; the value keeps any further '='
+const COOKIE_PAIR_RE = /(?:^|;)\s*([^=;\s][^=;]*)=([^;]*)/g;
+
+// Map-backed LRU: re-inserting moves a key to the end, the first key is oldest
+function cacheSet(cache, key, value, maxSize) {
+    cache.delete(key);
+    cache.set(key, value);
+    if (cache.size > maxSize) {
+        cache.delete(cache.keys().next().value);
+    }
+}
 
 // Cookie Parser
 class CookieParser {
     static parseCookieString(cookieString) {
-        const cookies = {};
+        if (!cookieString) return {};
         
-        if (!cookieString) return cookies;
+        let cookies = parsedCookieCache.get(cookieString);
+        if (!cookies) {
+            cookies = this.parseCookies(cookieString);
+        }
+        cacheSet(parsedCookieCache, cookieString, cookies, COOKIE_CACHE_SIZE);
+        return cookies;
+    }
+    
+    static parseCookies(cookieString) {
+        const cookies = {};
         
         try {
             // Remove whitespace
@@ -14,11 +50,7 @@ class CookieParser {
             
             // Try to decode base64
             if (this.isBase64(decodedString)) {
-                try {
-                    decodedString = Buffer.from(decodedString, 'base64').toString('utf-8');
-                } catch (e) {
-                    // Not base64, continue with original
-                }
+                decodedString = Buffer.from(decodedString, 'base64').toString('utf-8');
             }
             
             // Try to parse as JSON
@@ -48,15 +80,9 @@ class CookieParser {
             }
             
             // Parse as raw cookie string
-            const pairs = decodedString.split(';');
-            pairs.forEach(pair => {
-                if (pair.includes('=')) {
-                    const [name, ...valueParts] = pair.trim().split('=');
-                    if (name && valueParts.length > 0) {
-                        cookies[name.trim()] = decodeURIComponent(valueParts.join('=').trim());
-                    }
-                }
-            });
+            for (const [, name, value] of decodedString.matchAll(COOKIE_PAIR_RE)) {
+                cookies[name.trim()] = decodeURIComponent(value.trim());
+            }
             
         } catch (error) {
             console.error('Cookie parsing error:', error);
@@ -66,11 +92,15 @@ class CookieParser {
     }
     
     static isBase64(str) {
-        try {
-            return Buffer.from(str, 'base64').toString('base64') === str;
-        } catch (e) {
-            return false;
-        }
+        // Same answer as a decode + re-encode round trip, without the buffers
+        if (str.length % 4 !== 0 || !BASE64_RE.test(str)) return false;
+        
+        // Canonical padding: the last data character carries no leftover
+        // bits (4 spare bits before '==', 2 before '='), so 'YR==' is rejected
+        const padding = str.endsWith('==') ? 2 : str.endsWith('=') ? 1 : 0;
+        if (!padding) return true;
+        const bits = BASE64_ALPHABET.indexOf(str[str.length - padding - 1]);
+        return bits % (padding === 2 ? 16 : 4) === 0;
     }
     
     static validateCookies(cookies) {
@@ -83,39 +113,130 @@ class CookieParser {
     }
 }
 
+const isTableCell = name => name === 'td' || name === 'th';
+const SOCIAL_SERVICE_RE = /(facebook|instagram|whatsapp|fb|ig|wa)/i;
+const CANONICAL_SERVICES = {
+    'facebook': 'Facebook',
+    'fb': 'Facebook',
+    'instagram': 'Instagram',
+    'ig': 'Instagram',
+    'whatsapp': 'WhatsApp',
+    'wa': 'WhatsApp'
+};
+// Canonical service names accepted by the API endpoints
+const SOCIAL_MEDIA_RE = /facebook|instagram|whatsapp/i;
+
+// Streaming row extractor: calls onRow with the trimmed cell texts as each
+// </tr> closes, so only the current row is ever held in memory.
+function createRowParser(onRow) {
+    let cells = null;
+    let cellText = null;
+    
+    return new Parser({
+        onopentag(name) {
+            if (name === 'tr') {
+                cells = [];
+            } else if (cells && isTableCell(name)) {
+                cellText = '';
+            }
+        },
+        ontext(text) {
+            if (cellText !== null) {
+                cellText += text;
+            }
+        },
+        onclosetag(name) {
+            if (cellText !== null && isTableCell(name)) {
+                cells.push(cellText.trim());
+                cellText = null;
+            } else if (name === 'tr' && cells) {
+                onRow(cells);
+                cells = null;
+            }
+        }
+    });
+}
+
+// Shared HTTP client. A Netlify function instance handles one invocation at
+// a time, and concurrent calls are spread over separate instances. The
+// keep-alive agent therefore only helps sequential warm invocations on the
+// same instance, which reuse the TCP/TLS connection to iVAS.
+const ivasHttp = axios.create({
+    baseURL: 'https://www.ivasms.com',
+    httpsAgent: new https.Agent({ keepAlive: true, maxSockets: 50 }),
+    headers: {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'DNT': '1',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+        'Sec-Fetch-Dest': 'document',
+        'Sec-Fetch-Mode': 'navigate',
+        'Sec-Fetch-Site': 'none',
+        'Sec-Fetch-User': '?1'
+    },
+    validateStatus: () => true
+});
+
+// Reads at most maxBytes from a response stream, then drops the rest of the
+// body so large pages are neither downloaded in full nor decoded. Destroying
+// the stream also closes its keep-alive socket; bodies that end within
+// maxBytes finish normally and leave the socket reusable.
+function readPreview(stream, maxBytes, timeout) {
+    return new Promise((resolve, reject) => {
+        const chunks = [];
+        let length = 0;
+        let settled = false;
+        const settle = error => {
+            if (settled) return;
+            settled = true;
+            clearTimeout(timer);
+            if (error) return reject(error);
+            // StringDecoder holds back a trailing partial character instead
+            // of emitting U+FFFD for a multi-byte sequence cut at maxBytes
+            const decoder = new StringDecoder('utf8');
+            resolve(decoder.write(Buffer.concat(chunks).subarray(0, maxBytes)));
+        };
+        
+        // axios' timeout stops at the response headers for stream responses
+        const timer = setTimeout(() => {
+            stream.destroy(new Error(`Preview timed out after ${timeout}ms`));
+        }, timeout);
+        
+        stream.on('data', chunk => {
+            chunks.push(chunk);
+            length += chunk.length;
+            if (length >= maxBytes) {
+                settle();
+                stream.destroy();
+            }
+        });
+        // finished() also fires on a close without 'end' or 'error'
+        finished(stream, error => settle(error));
+    });
+}
+
 // IVAS Client
 class IVASClient {
     constructor(cookies) {
         this.cookies = cookies;
-        this.baseURL = 'https://www.ivasms.com';
-        this.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-User': '?1',
-            'Cookie': Object.keys(cookies).map(key => `${key}=${cookies[key]}`).join('; ')
-        };
+        this.cookieHeader = Object.keys(cookies).map(key => `${key}=${cookies[key]}`).join('; ');
     }
     
     async testConnection() {
         try {
-            const response = await axios.get(`${this.baseURL}/portal/live/test_sms`, {
-                headers: this.headers,
+            const response = await ivasHttp.get('/portal/live/test_sms', {
+                headers: { 'Cookie': this.cookieHeader },
                 timeout: 10000,
-                validateStatus: () => true
+                responseType: 'stream'
             });
             
             return {
                 success: response.status === 200 || response.status === 302,
                 status: response.status,
-                data: response.data?.substring?.(0, 500) || ''
+                data: await readPreview(response.data, 500, 10000)
             };
         } catch (error) {
             return {
@@ -126,68 +247,113 @@ class IVASClient {
         }
     }
     
-    async fetchSMSData() {
+    fetchSMSData() {
+        // fetch-data and stats share entries per Cookie header. An entry is
+        // stored while its request is still in flight (time === null), so
+        // overlapping calls await the same fetch instead of each hitting iVAS.
+        // Limitation: a Netlify instance runs one invocation at a time, so in
+        // production requests fired together land on separate instances and
+        // are not coalesced; the cache then only serves sequential warm calls
+        // within the TTL. Coalescing applies under netlify dev.
+        const key = this.cookieHeader;
+        const cached = smsDataCache.get(key);
+        if (cached && (cached.time === null || Date.now() - cached.time < SMS_CACHE_TTL)) {
+            return cached.data;
+        }
+        
+        const entry = { time: null, data: null };
+        entry.data = this.requestSMSData().then(data => {
+            if (data) {
+                entry.time = Date.now();
+                return data;
+            }
+            // Don't cache failures
+            if (smsDataCache.get(key) === entry) {
+                smsDataCache.delete(key);
+            }
+            return [];
+        });
+        cacheSet(smsDataCache, key, entry, SMS_CACHE_SIZE);
+        return entry.data;
+    }
+    
+    async requestSMSData() {
         try {
-            const response = await axios.get(`${this.baseURL}/portal/live/test_sms`, {
-                headers: this.headers,
-                timeout: 30000,
-                validateStatus: () => true
+            const response = await ivasHttp.get('/portal/live/test_sms', {
+                headers: { 'Cookie': this.cookieHeader },
+                timeout: SMS_FETCH_TIMEOUT,
+                responseType: 'stream'
             });
             
             if (response.status === 200) {
-                return this.parseSMSData(response.data);
+                return await this.parseSMSStream(response.data);
             }
-            return [];
+            response.data.destroy();
+            return null;
         } catch (error) {
             console.error('Fetch error:', error);
-            return [];
+            return null;
         }
     }
     
-    parseSMSData(htmlContent) {
-        try {
-            const $ = cheerio.load(htmlContent);
+    parseSMSStream(stream) {
+        return new Promise((resolve, reject) => {
             const data = [];
-            
-            // Parse tables
-            $('table').each((index, table) => {
-                $(table).find('tr').each((rowIndex, row) => {
-                    const cells = $(row).find('td, th');
-                    if (cells.length >= 4) {
-                        const smsEntry = {
-                            'sid': $(cells[0]).text().trim() || '',
-                            'message': $(cells[1]).text().trim() || '',
-                            'service': $(cells[2]).text().trim() || '',
-                            'country': $(cells[3]).text().trim() || '',
-                            'range': cells.length > 4 ? $(cells[4]).text().trim() : '',
-                            'content': cells.length > 5 ? $(cells[5]).text().trim() : $(cells[1]).text().trim(),
-                            'timestamp': new Date().toISOString()
-                        };
-                        
-                        // Filter for social media
-                        const serviceLower = smsEntry.service.toLowerCase();
-                        const socialKeywords = ['facebook', 'instagram', 'whatsapp', 'fb', 'ig', 'wa'];
-                        if (socialKeywords.some(keyword => serviceLower.includes(keyword))) {
-                            // Standardize service names
-                            if (serviceLower.includes('facebook') || serviceLower.includes('fb')) {
-                                smsEntry.service = 'Facebook';
-                            } else if (serviceLower.includes('instagram') || serviceLower.includes('ig')) {
-                                smsEntry.service = 'Instagram';
-                            } else if (serviceLower.includes('whatsapp') || serviceLower.includes('wa')) {
-                                smsEntry.service = 'WhatsApp';
-                            }
-                            
-                            data.push(smsEntry);
-                        }
-                    }
-                });
+            const timestamp = Date.now();
+            const parser = createRowParser(cells => {
+                const smsEntry = this.toSMSEntry(cells, timestamp);
+                if (smsEntry) data.push(smsEntry);
             });
             
-            return data;
-        } catch (error) {
-            console.error('Parse error:', error);
-            return [];
-        }
+            // axios' timeout stops at the response headers for stream
+            // responses, so the body gets its own deadline
+            const timer = setTimeout(() => {
+                stream.destroy(new Error(`SMS page body timed out after ${SMS_FETCH_TIMEOUT}ms`));
+            }, SMS_FETCH_TIMEOUT);
+            
+            // Parser callbacks run inside stream events; route anything they
+            // throw into the promise instead of letting it escape uncaught
+            stream.setEncoding('utf8');
+            stream.on('data', chunk => {
+                try {
+                    parser.write(chunk);
+                } catch (error) {
+                    stream.destroy(error);
+                }
+            });
+            // finished() also fires on a close without 'end' or 'error', so
+            // the promise always settles
+            finished(stream, error => {
+                clearTimeout(timer);
+                if (error) return reject(error);
+                try {
+                    parser.end();
+                    resolve(data);
+                } catch (parseError) {
+                    reject(parseError);
+                }
+            });
+        });
+    }
+    
+    toSMSEntry(cells, timestamp) {
+        if (cells.length < 4) return null;
+        
+        // Filter for social media and standardize the service name
+        const match = SOCIAL_SERVICE_RE.exec(cells[2]);
+        if (!match) return null;
+        
+        const smsEntry = {
+            'sid': cells[0],
+            'message': cells[1],
+            'service': CANONICAL_SERVICES[match[1].toLowerCase()],
+            'country': cells[3],
+            'range': cells.length > 4 ? cells[4] : '',
+            'content': cells.length > 5 ? cells[5] : cells[1],
+            'timestamp': timestamp
+        };
+        
+        return smsEntry;
     }
 }
 
@@ -232,4 +398,4 @@ class ResponseHelper {
     }
 }
 
-module.exports = { CookieParser, IVASClient, ResponseHelper };
\ No newline at end of file
+module.exports = { CookieParser, IVASClient, ResponseHelper, SOCIAL_MEDIA_RE };
\ No newline at end of file